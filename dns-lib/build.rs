@@ -0,0 +1,33 @@
+use std::{env, fs::File, io::{self, BufReader, BufWriter, Write}, path::Path};
+
+#[path = "src/resource_record/port_assignments.rs"]
+mod port_assignments;
+
+// Gets updated by running "get-port-assignments.sh", which is at the root of the repository.
+const PORT_ASSIGNMENTS_PATH: &'static str = "port-assignments.xml";
+const PORT_FROM_SERVICE_FILE_NAME: &'static str = "port_from_service.rs";
+
+fn main() -> io::Result<()> {
+    println!("cargo:rerun-if-changed=build.rs");
+    println!("cargo:rerun-if-changed=src/resource_record/port_assignments.rs");
+    println!("cargo:rerun-if-changed={PORT_ASSIGNMENTS_PATH}");
+
+    let port_assignments = match File::open(PORT_ASSIGNMENTS_PATH) {
+        Ok(port_assignments) => BufReader::new(port_assignments),
+        Err(error) => return Err(io::Error::new(error.kind(), format!("Failed to open '{PORT_ASSIGNMENTS_PATH}': {error}"))),
+    };
+    let (port_service_map, skipped_records) = port_assignments::read_port_service_map(port_assignments)?;
+    for error in skipped_records {
+        println!("cargo:warning=Failed to parse port: {error}");
+    }
+
+    let out_dir = match env::var_os("OUT_DIR") {
+        Some(out_dir) => out_dir,
+        None => return Err(io::Error::new(io::ErrorKind::NotFound, "The OUT_DIR environment variable is not set")),
+    };
+    let mut file = BufWriter::new(File::create(Path::new(&out_dir).join(PORT_FROM_SERVICE_FILE_NAME))?);
+    writeln!(file, "// Generated by build.rs from {PORT_ASSIGNMENTS_PATH}. Do not edit.")?;
+    writeln!(file)?;
+    port_assignments::write_port_service_table(&port_service_map, &mut file)?;
+    file.flush()
+}
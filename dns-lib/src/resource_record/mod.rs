@@ -11,6 +11,8 @@ pub mod opcode;
 pub mod key_protocol;
 pub mod protocol;
 pub(crate) mod port_from_service;
+#[cfg(test)]
+mod port_assignments;
 pub mod ports;
 pub mod address_family;
 pub mod time;
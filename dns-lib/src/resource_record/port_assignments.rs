@@ -0,0 +1,458 @@
+// Parses the IANA port assignments into the port service table. This is included by `build.rs`,
+// which generates the table, and is only compiled into the library so that it can be tested.
+
+use std::{collections::BTreeMap, io::{self, BufRead, Write}, ops::RangeInclusive};
+
+use quick_xml::{events::Event, Reader};
+
+const RECORD_LOCAL_NAME: &'static [u8] = b"record";
+const NAME_LOCAL_NAME: &'static [u8] = b"name";
+const PROTOCOL_LOCAL_NAME: &'static [u8] = b"protocol";
+const NUMBER_LOCAL_NAME: &'static [u8] = b"number";
+
+/// The child entries of a record that we care about. While one of these is open, its text is
+/// collected so that it can be parsed once the entry is closed. Every other entry within a record
+/// is skipped.
+#[derive(Clone, Copy, PartialEq, Eq, Debug)]
+enum RecordField {
+    Name = 0,
+    Protocol = 1,
+    Number = 2,
+}
+
+impl RecordField {
+    const COUNT: usize = 3;
+
+    #[inline]
+    fn index(&self) -> usize {
+        *self as usize
+    }
+
+    #[inline]
+    fn from_local_name(local_name: &[u8]) -> Option<Self> {
+        match local_name {
+            NAME_LOCAL_NAME => Some(Self::Name),
+            PROTOCOL_LOCAL_NAME => Some(Self::Protocol),
+            NUMBER_LOCAL_NAME => Some(Self::Number),
+            _ => None,
+        }
+    }
+
+    #[inline]
+    fn description(&self) -> &'static str {
+        match self {
+            Self::Name => "name",
+            Self::Protocol => "protocol",
+            Self::Number => "port (number)",
+        }
+    }
+}
+
+/// Parses a single decimal port, rejecting anything that is not an integer from 0 to 65535.
+#[inline]
+fn parse_port(characters: &str) -> io::Result<u16> {
+    match u16::from_str_radix(characters, 10) {
+        Ok(port) => Ok(port),
+        Err(int_error) => Err(io::Error::new(io::ErrorKind::InvalidData, format!("The port (number) '{characters}' is not an integer between 0 and {}: {int_error}", u16::MAX))),
+    }
+}
+
+/// Every port entry is either a single port or a contiguous range of ports, so it is kept as an
+/// inclusive range. The ports are only written out once they are merged into the service map.
+fn parse_ports(characters: &str) -> io::Result<RangeInclusive<u16>> {
+    match characters.split_once('-') {
+        None => {
+            let port = parse_port(characters)?;
+            Ok(port..=port)
+        },
+        Some((lower_bound, upper_bound)) if !upper_bound.contains('-') => {
+            let lower_bound = parse_port(lower_bound)?;
+            let upper_bound = parse_port(upper_bound)?;
+            if lower_bound > upper_bound {
+                return Err(io::Error::new(io::ErrorKind::InvalidData, format!("The port (number) entry has a lower bound that is greater than the upper bound ({lower_bound} > {upper_bound}). Found '{characters}'. The lower bound must be at most equal to the upper bound")));
+            }
+            Ok(lower_bound..=upper_bound)
+        },
+        _ => Err(io::Error::new(io::ErrorKind::InvalidData, format!("The port (number) must have either a single non-negative integer ('\\d+') or a range formatted as '\\d+-\\d+'. Found '{characters}'"))),
+    }
+}
+
+/// Reads the events of a single record, up to and including its end tag. The record's children are
+/// visited once, in order. Each child that is one of the `RecordField`s has its text collected
+/// into the slot at its index, so no child needs to be looked up again afterwards. The fields are
+/// parsed once the whole record has been read.
+///
+/// Malformed records are reported with `io::ErrorKind::InvalidData`. Any other error means that the
+/// file itself could not be read.
+fn parse_record<R: BufRead>(reader: &mut Reader<R>, buffer: &mut Vec<u8>) -> io::Result<Option<(String, String, RangeInclusive<u16>)>> {
+    let mut fields: [Option<String>; RecordField::COUNT] = Default::default();
+    let mut current_field: Option<RecordField> = None;
+
+    loop {
+        buffer.clear();
+        match (current_field, reader.read_event_into(buffer)) {
+            (_, Ok(Event::Eof)) => return Err(io::Error::from(io::ErrorKind::UnexpectedEof)),
+            (Some(field), Ok(Event::Start(element) | Event::Empty(element))) => {
+                return Err(io::Error::new(io::ErrorKind::InvalidData, format!("The {0} entry cannot have another nested entry. Found {0} entry named '{1}'", field.description(), String::from_utf8_lossy(element.local_name().as_ref()))));
+            },
+            (None, Ok(Event::Start(element))) => {
+                current_field = RecordField::from_local_name(element.local_name().as_ref());
+                if let Some(field) = current_field {
+                    if fields[field.index()].is_some() {
+                        return Err(io::Error::new(io::ErrorKind::InvalidData, format!("The {} entry was found twice within a record. It can only appear once.", field.description())));
+                    }
+                }
+            },
+            (Some(field), Ok(Event::Text(characters))) => match characters.unescape() {
+                Ok(characters) => fields[field.index()].get_or_insert_with(String::new).push_str(&characters),
+                Err(error) => return Err(io::Error::new(io::ErrorKind::InvalidData, error)),
+            },
+            (Some(field), Ok(Event::CData(characters))) => match characters.decode() {
+                Ok(characters) => fields[field.index()].get_or_insert_with(String::new).push_str(&characters),
+                Err(error) => return Err(io::Error::new(io::ErrorKind::InvalidData, error)),
+            },
+            // The reader checks that end tags match their start tags, so this closes the field.
+            (Some(_), Ok(Event::End(_))) => current_field = None,
+            (None, Ok(Event::End(element))) => {
+                if element.local_name().as_ref() == RECORD_LOCAL_NAME {
+                    break;
+                }
+            },
+            (_, Ok(_)) => (),
+            (_, Err(error)) => return Err(io::Error::new(io::ErrorKind::Other, error)),
+        }
+    }
+
+    let [name, protocol, ports] = fields;
+    // The ports are parsed whenever they are present so that a malformed port is still reported
+    // if the record is missing its name or protocol.
+    let ports = match ports {
+        Some(ports) => Some(parse_ports(&ports)?),
+        None => None,
+    };
+    match (name, protocol, ports) {
+        (Some(mut name), Some(mut protocol), Some(ports)) => {
+            // Service names (RFC 6335) are ASCII and the reader already trims the surrounding
+            // whitespace.
+            name.make_ascii_lowercase();
+            // Protocol mnemonics are upper case. They are checked against the `Protocol` type when
+            // the table is first used.
+            protocol.make_ascii_uppercase();
+            Ok(Some((name, protocol, ports)))
+        },
+        _ => Ok(None),
+    }
+}
+
+#[inline]
+fn finalize_ports(ports: &mut Vec<u16>) {
+    ports.sort_unstable();
+    ports.dedup();
+}
+
+/// Reads every record from the port assignments XML. The map is keyed by (protocol, service) so
+/// that iterating over it visits each protocol's services together and in sorted order.
+///
+/// Malformed records are skipped and their errors are returned alongside the map. Any other error
+/// means that the file itself could not be read.
+pub fn read_port_service_map<R: BufRead>(reader: R) -> io::Result<(BTreeMap<(String, String), Vec<u16>>, Vec<io::Error>)> {
+    let mut reader = Reader::from_reader(reader);
+    reader.config_mut().trim_text(true);
+
+    let mut buffer = Vec::new();
+    let mut port_service_map: BTreeMap<(String, String), Vec<u16>> = BTreeMap::new();
+    let mut skipped_records = Vec::new();
+
+    loop {
+        buffer.clear();
+        let is_record = match reader.read_event_into(&mut buffer) {
+            Ok(Event::Eof) => break,
+            Ok(Event::Start(element)) => element.local_name().as_ref() == RECORD_LOCAL_NAME,
+            Ok(_) => false,
+            Err(error) => return Err(io::Error::new(io::ErrorKind::Other, error)),
+        };
+        if !is_record {
+            continue;
+        }
+        match parse_record(&mut reader, &mut buffer) {
+            Ok(Some((name, protocol, ports))) => {
+                port_service_map.entry((protocol, name))
+                    .or_default()
+                    .extend(ports);
+            },
+            Ok(None) => (),
+            Err(error) if error.kind() == io::ErrorKind::InvalidData => skipped_records.push(error),
+            Err(error) => return Err(error),
+        }
+    }
+
+    // A service can be listed by more than one record, and those records can overlap or be out of
+    // order (especially once custom ports are added to the file). Each service's ports are put in
+    // order exactly once, after every record has been merged.
+    for ports in port_service_map.values_mut() {
+        finalize_ports(ports);
+    }
+
+    Ok((port_service_map, skipped_records))
+}
+
+/// Writes out `MAX_SERVICE_LENGTH`, `PORTS` and `PROTOCOL_SERVICES`, which `build.rs` generates
+/// for `port_from_service.rs`.
+///
+/// All of the services' ports are stored in the single shared `PORTS` table. Services with
+/// identical port lists (commonly the TCP and UDP entries for the same service) refer to the same
+/// `start..end` slice of that table instead of each getting a copy. Everything is written out in
+/// sorted order so that the generated file only changes when the registry does.
+pub fn write_port_service_table<W: Write>(port_service_map: &BTreeMap<(String, String), Vec<u16>>, out: &mut W) -> io::Result<()> {
+    let mut ports = Vec::new();
+    let mut slices: BTreeMap<&[u16], (usize, usize)> = BTreeMap::new();
+    let mut protocol_services: BTreeMap<&str, Vec<(&str, usize, usize)>> = BTreeMap::new();
+    for ((protocol, service), service_ports) in port_service_map {
+        let (start, end) = *slices.entry(service_ports.as_slice())
+            .or_insert_with(|| {
+                let start = ports.len();
+                ports.extend_from_slice(service_ports);
+                (start, ports.len())
+            });
+        protocol_services.entry(protocol.as_str())
+            .or_default()
+            .push((service.as_str(), start, end));
+    }
+    if u32::try_from(ports.len()).is_err() {
+        return Err(io::Error::new(io::ErrorKind::InvalidData, "The port table cannot hold more than u32::MAX ports"));
+    }
+
+    let max_service_length = port_service_map.keys()
+        .map(|(_, service)| service.len())
+        .max()
+        .unwrap_or(0);
+
+    writeln!(out, "const MAX_SERVICE_LENGTH: usize = {max_service_length};")?;
+    writeln!(out)?;
+    writeln!(out, "static PORTS: [u16; {}] = [", ports.len())?;
+    for ports in ports.chunks(16) {
+        write!(out, "   ")?;
+        for port in ports {
+            write!(out, " {port},")?;
+        }
+        writeln!(out)?;
+    }
+    writeln!(out, "];")?;
+    writeln!(out)?;
+    writeln!(out, "static PROTOCOL_SERVICES: [(&str, &[(&str, u32, u32)]); {}] = [", protocol_services.len())?;
+    for (protocol, services) in &protocol_services {
+        writeln!(out, "    ({protocol:?}, &[")?;
+        for (service, start, end) in services {
+            writeln!(out, "        ({service:?}, {start}, {end}),")?;
+        }
+        writeln!(out, "    ]),")?;
+    }
+    writeln!(out, "];")
+}
+
+#[cfg(test)]
+mod parse_ports_tests {
+    use super::parse_ports;
+
+    #[test]
+    fn test_single_port() {
+        assert_eq!(53..=53, parse_ports("53").unwrap());
+        assert_eq!(0..=0, parse_ports("0").unwrap());
+        assert_eq!(u16::MAX..=u16::MAX, parse_ports("65535").unwrap());
+    }
+
+    #[test]
+    fn test_port_range() {
+        assert_eq!(6000..=6063, parse_ports("6000-6063").unwrap());
+        assert_eq!(80..=80, parse_ports("80-80").unwrap());
+        assert_eq!(49152..=u16::MAX, parse_ports("49152-65535").unwrap());
+    }
+
+    #[test]
+    fn test_bad_ports() {
+        assert!(parse_ports("").is_err());
+        assert!(parse_ports("65536").is_err());
+        assert!(parse_ports("-53").is_err());
+        assert!(parse_ports("53-").is_err());
+        assert!(parse_ports("1-2-3").is_err());
+        assert!(parse_ports("6063-6000").is_err());
+        assert!(parse_ports("domain").is_err());
+    }
+}
+
+#[cfg(test)]
+mod finalize_ports_tests {
+    use super::finalize_ports;
+
+    #[test]
+    fn test_sorts_and_removes_duplicates() {
+        let mut ports = vec![6001, 6000, 6002, 22, 6000, 6001, 22];
+        finalize_ports(&mut ports);
+        assert_eq!(vec![22, 6000, 6001, 6002], ports);
+    }
+
+    #[test]
+    fn test_already_final() {
+        let mut ports = vec![1, 2, 3];
+        finalize_ports(&mut ports);
+        assert_eq!(vec![1, 2, 3], ports);
+
+        let mut ports = vec![];
+        finalize_ports(&mut ports);
+        assert!(ports.is_empty());
+    }
+}
+
+#[cfg(test)]
+mod parse_record_tests {
+    use std::{io, ops::RangeInclusive};
+
+    use quick_xml::{events::Event, Reader};
+
+    use super::parse_record;
+
+    /// Parses the record that `xml` starts with.
+    fn parse(xml: &str) -> io::Result<Option<(String, String, RangeInclusive<u16>)>> {
+        let mut reader = Reader::from_reader(xml.as_bytes());
+        reader.config_mut().trim_text(true);
+        let mut buffer = Vec::new();
+        match reader.read_event_into(&mut buffer) {
+            Ok(Event::Start(element)) => assert_eq!(b"record", element.local_name().as_ref()),
+            event => panic!("Expected a record start tag. Found {event:?}"),
+        }
+        parse_record(&mut reader, &mut buffer)
+    }
+
+    #[test]
+    fn test_complete_record() {
+        assert_eq!(
+            Some(("ssh".to_string(), "TCP".to_string(), 22..=22)),
+            parse("<record><name>ssh</name><protocol>tcp</protocol><description>SSH</description><number>22</number></record>").unwrap()
+        );
+        assert_eq!(
+            Some(("x11".to_string(), "UDP".to_string(), 6000..=6063)),
+            parse("<record><number> 6000-6063 </number><protocol>UDP</protocol><name>X11</name></record>").unwrap()
+        );
+    }
+
+    #[test]
+    fn test_incomplete_record() {
+        assert_eq!(None, parse("<record><protocol>tcp</protocol><number>22</number></record>").unwrap());
+        assert_eq!(None, parse("<record><name>ssh</name><number>22</number></record>").unwrap());
+        assert_eq!(None, parse("<record><name>ssh</name><protocol>tcp</protocol></record>").unwrap());
+        assert_eq!(None, parse("<record><name></name><protocol>tcp</protocol><number>22</number></record>").unwrap());
+    }
+
+    #[test]
+    fn test_bad_record() {
+        // A malformed port is reported even if the record is incomplete.
+        assert_eq!(io::ErrorKind::InvalidData, parse("<record><name>ssh</name><number>x</number></record>").unwrap_err().kind());
+        assert_eq!(io::ErrorKind::InvalidData, parse("<record><name>ssh</name><protocol>tcp</protocol><number>4-2</number></record>").unwrap_err().kind());
+        assert_eq!("The name entry was found twice within a record. It can only appear once.", parse("<record><name>ssh</name><name>ssh</name><protocol>tcp</protocol><number>22</number></record>").unwrap_err().to_string());
+        assert_eq!(io::ErrorKind::InvalidData, parse("<record><name>ssh<xref/></name><protocol>tcp</protocol><number>22</number></record>").unwrap_err().kind());
+        assert_eq!(io::ErrorKind::UnexpectedEof, parse("<record><name>ssh</name><protocol>tcp</protocol>").unwrap_err().kind());
+    }
+}
+
+#[cfg(test)]
+mod read_port_service_map_tests {
+    use std::io;
+
+    use super::read_port_service_map;
+
+    #[test]
+    fn test_records_are_merged() {
+        // Setup
+        let xml = r#"<?xml version='1.0' encoding='UTF-8'?>
+            <registry xmlns="http://www.iana.org/assignments" id="service-names-port-numbers">
+              <title>Service Name and Transport Protocol Port Number Registry</title>
+              <record>
+                <name>x11</name>
+                <protocol>tcp</protocol>
+                <number>6001-6002</number>
+              </record>
+              <!-- <record><name>ssh</name><protocol>tcp</protocol><number>2222</number></record> -->
+              <record>
+                <name>X11</name>
+                <protocol>tcp</protocol>
+                <number>6000-6001</number>
+              </record>
+              <record>
+                <name>ssh</name>
+                <protocol>tcp</protocol>
+                <number>22</number>
+              </record>
+              <record>
+                <name>ssh</name>
+                <protocol>udp</protocol>
+                <number>not-a-port</number>
+              </record>
+              <record>
+                <protocol>tcp</protocol>
+                <number>23</number>
+              </record>
+              <people>
+                <person id="someone"><name>Someone</name></person>
+              </people>
+            </registry>"#;
+
+        // Test
+        let (port_service_map, skipped_records) = read_port_service_map(xml.as_bytes()).unwrap();
+
+        // Check
+        assert_eq!(2, port_service_map.len());
+        assert_eq!(Some(&vec![22]), port_service_map.get(&("TCP".to_string(), "ssh".to_string())));
+        assert_eq!(Some(&vec![6000, 6001, 6002]), port_service_map.get(&("TCP".to_string(), "x11".to_string())));
+        assert_eq!(1, skipped_records.len());
+        assert_eq!(io::ErrorKind::InvalidData, skipped_records[0].kind());
+        assert!(skipped_records[0].to_string().contains("'not-a-port'"), "unexpected error: {}", skipped_records[0]);
+    }
+
+    #[test]
+    fn test_bad_xml() {
+        assert!(read_port_service_map("<registry><record><name>ssh</protocol></record></registry>".as_bytes()).is_err());
+    }
+}
+
+#[cfg(test)]
+mod write_port_service_table_tests {
+    use std::collections::BTreeMap;
+
+    use super::write_port_service_table;
+
+    #[test]
+    fn test_identical_ports_are_shared() {
+        // Setup
+        let mut port_service_map = BTreeMap::new();
+        port_service_map.insert(("TCP".to_string(), "domain".to_string()), vec![53]);
+        port_service_map.insert(("UDP".to_string(), "domain".to_string()), vec![53]);
+        port_service_map.insert(("TCP".to_string(), "x11".to_string()), vec![6000, 6001, 6002]);
+        port_service_map.insert(("UDP".to_string(), "x11".to_string()), vec![6000, 6001, 6002]);
+        port_service_map.insert(("TCP".to_string(), "ssh".to_string()), vec![22]);
+        let mut out = Vec::new();
+
+        // Test
+        write_port_service_table(&port_service_map, &mut out).unwrap();
+
+        // Check
+        let expected = r#"const MAX_SERVICE_LENGTH: usize = 6;
+
+static PORTS: [u16; 5] = [
+    53, 22, 6000, 6001, 6002,
+];
+
+static PROTOCOL_SERVICES: [(&str, &[(&str, u32, u32)]); 2] = [
+    ("TCP", &[
+        ("domain", 0, 1),
+        ("ssh", 1, 2),
+        ("x11", 2, 5),
+    ]),
+    ("UDP", &[
+        ("domain", 0, 1),
+        ("x11", 2, 5),
+    ]),
+];
+"#;
+        assert_eq!(expected, String::from_utf8(out).unwrap());
+    }
+}
@@ -1,238 +1,116 @@
 use super::{ports::PortError, protocol::Protocol};
 
-use std::{collections::HashMap, fs::File, io::{self, BufReader, Read}, time::Instant};
+// Defines `MAX_SERVICE_LENGTH`, `PORTS` and `PROTOCOL_SERVICES`. These are generated by `build.rs`
+// from the file "port-assignments.xml".
+include!(concat!(env!("OUT_DIR"), "/port_from_service.rs"));
 
-use lazy_static::lazy_static;
-use xml::{reader::XmlEvent, EventReader, ParserConfig};
-
-
-const RECORD_LOCAL_NAME: &'static str = "record";
-const NAME_LOCAL_NAME: &'static str = "name";
-const PROTOCOL_LOCAL_NAME: &'static str = "protocol";
-const NUMBER_LOCAL_NAME: &'static str = "number";
-
-fn parse_protocol<R>(parser: &mut EventReader<R>) -> io::Result<Option<Protocol>> where R: Read {
-    let mut protocol = None;
-
-    loop {
-        let event = parser.next();
-        match event {
-            Ok(XmlEvent::EndDocument) => return Err(io::Error::from(io::ErrorKind::UnexpectedEof)),
-            Ok(XmlEvent::StartElement { name, attributes: _, namespace: _ }) => return Err(io::Error::new(io::ErrorKind::InvalidData, format!("The protocol entry cannot have another nested entry. Found protocol entry named '{}'", name.local_name))),
-            Ok(XmlEvent::Characters(characters)) => {
-                match protocol {
-                    Some(previous_protocol) => return Err(io::Error::new(io::ErrorKind::InvalidData, format!("The protocol entry was found twice in a single record. Can only appear once. First protocol define was '{previous_protocol}'. Second was '{characters}'"))),
-                    None => {
-                        protocol = match Protocol::from_str(&characters.to_uppercase()) {
-                            Ok(protocol) => Some(protocol),
-                            Err(protocol_error) => return Err(io::Error::new(io::ErrorKind::InvalidData, protocol_error.to_string())),
-                        };
-                    },
-                }
-            },
-            Ok(XmlEvent::EndElement { name }) => {
-                if name.local_name != PROTOCOL_LOCAL_NAME {
-                    return Err(io::Error::new(io::ErrorKind::InvalidData, format!("A protocol entry was closed with a '{}' tag", name.local_name)));
-                }
-                break;
-            },
-            Ok(_) => (),
-            Err(error) => return Err(io::Error::new(io::ErrorKind::Other, error)),
-        }
-    }
-    
-    return Ok(protocol);
+/// Each protocol's services are generated in sorted order, so the service is found with a binary
+/// search. The ports are a slice of the generated `PORTS` table, which services with identical
+/// ports share.
+#[inline]
+fn ports_from_table(service: &str, protocol: Protocol) -> Option<&'static [u16]> {
+    let (_, services) = PROTOCOL_SERVICES.iter()
+        .find(|(mnemonic, _)| Protocol::from_str(mnemonic).map_or(false, |mnemonic_protocol| mnemonic_protocol == protocol))?;
+    let index = services.binary_search_by(|(name, _, _)| (*name).cmp(service)).ok()?;
+    let (_, start, end) = services[index];
+    Some(&PORTS[(start as usize)..(end as usize)])
 }
 
-fn parse_name<R>(parser: &mut EventReader<R>) -> io::Result<Option<String>> where R: Read {
-    let mut name = None;
-
-    loop {
-        let event = parser.next();
-        match event {
-            Ok(XmlEvent::EndDocument) => return Err(io::Error::from(io::ErrorKind::UnexpectedEof)),
-            Ok(XmlEvent::StartElement { name, attributes: _, namespace: _ }) => return Err(io::Error::new(io::ErrorKind::InvalidData, format!("The name entry cannot have another nested entry. Found name entry named '{}'", name.local_name))),
-            Ok(XmlEvent::Characters(characters)) => {
-                match name {
-                    Some(previous_name) => return Err(io::Error::new(io::ErrorKind::InvalidData, format!("The name entry was found twice in a single record. Can only appear once. First named '{previous_name}'. Second named '{characters}'"))),
-                    None => name = Some(characters.trim().to_lowercase()),
-                }
-            },
-            Ok(XmlEvent::EndElement { name }) => {
-                if name.local_name != NAME_LOCAL_NAME {
-                    return Err(io::Error::new(io::ErrorKind::InvalidData, format!("A name entry was closed with a '{}' tag", name.local_name)));
-                }
-                break;
-            },
-            Ok(_) => (),
-            Err(error) => return Err(io::Error::new(io::ErrorKind::Other, error)),
+#[inline]
+pub fn port_from_service(service: &str, protocol: Protocol) -> Result<&'static [u16], PortError> {
+    // Service names are case insensitive and are stored in lower case. Zone files almost always use
+    // lower case already, in which case the service is looked up as-is. Otherwise, it is lower cased
+    // into a stack buffer. A name longer than every registered service cannot match at all.
+    let ports = if service.len() > MAX_SERVICE_LENGTH {
+        None
+    } else if !service.bytes().any(|byte| byte.is_ascii_uppercase()) {
+        ports_from_table(service, protocol)
+    } else {
+        let mut buffer = [0; MAX_SERVICE_LENGTH];
+        let lower_service = &mut buffer[..service.len()];
+        lower_service.copy_from_slice(service.as_bytes());
+        lower_service.make_ascii_lowercase();
+        // Changing the case of ASCII letters cannot make valid UTF-8 invalid.
+        match std::str::from_utf8(lower_service) {
+            Ok(lower_service) => ports_from_table(lower_service, protocol),
+            Err(_) => None,
         }
+    };
+    match ports {
+        Some(ports) => Ok(ports),
+        None => Err(PortError::UnknownMnemonic(service.to_string(), protocol)),
     }
-    
-    return Ok(name);
 }
 
-fn parse_ports<R>(parser: &mut EventReader<R>) -> io::Result<Option<Vec<u16>>> where R: Read {
-    let mut ports = None;
+#[cfg(test)]
+mod generated_table_tests {
+    use super::{MAX_SERVICE_LENGTH, PORTS, PROTOCOL_SERVICES};
+
+    #[test]
+    fn test_max_service_length() {
+        let longest_service = PROTOCOL_SERVICES.iter()
+            .flat_map(|(_, services)| services.iter())
+            .map(|(service, _, _)| service.len())
+            .max();
+        assert_eq!(Some(MAX_SERVICE_LENGTH), longest_service);
+    }
 
-    loop {
-        let event = parser.next();
-        match event {
-            Ok(XmlEvent::EndDocument) => return Err(io::Error::from(io::ErrorKind::UnexpectedEof)),
-            Ok(XmlEvent::StartElement { name, attributes: _, namespace: _ }) => return Err(io::Error::new(io::ErrorKind::InvalidData, format!("The port (number) entry cannot have another nested entry. Found port (number) entry named '{}'", name.local_name))),
-            Ok(XmlEvent::Characters(characters)) => {
-                match ports {
-                    Some(_) => return Err(io::Error::new(io::ErrorKind::InvalidData, format!("The port (number) entry was found twice in a single record. Can only appear once. Redefined with ports '{characters}'"))),
-                    None => {
-                        match characters.split("-").collect::<Vec<&str>>().as_slice() {
-                            &[port] => {
-                                let port = match u16::from_str_radix(port, 10) {
-                                    Ok(port) => port,
-                                    Err(int_error) => return Err(io::Error::new(io::ErrorKind::InvalidData, int_error)),
-                                };
-                                ports = Some(vec![port]);
-                            },
-                            &[lower_bound, upper_bound] => {
-                                let lower_bound = match u16::from_str_radix(lower_bound, 10) {
-                                    Ok(lower_bound) => lower_bound,
-                                    Err(int_error) => return Err(io::Error::new(io::ErrorKind::InvalidData, int_error)),
-                                };
-                                let upper_bound = match u16::from_str_radix(upper_bound, 10) {
-                                    Ok(upper_bound) => upper_bound,
-                                    Err(int_error) => return Err(io::Error::new(io::ErrorKind::InvalidData, int_error)),
-                                };
-                                if lower_bound > upper_bound {
-                                    return Err(io::Error::new(io::ErrorKind::InvalidData, format!("The port (number) entry has a lower bound that is greater than the upper bound ({lower_bound} > {upper_bound}). Found '{characters}'. The lower bound must be at most equal to the upper bound")));
-                                }
-                                ports = Some((lower_bound..=upper_bound).collect());
-                            },
-                            _ => return Err(io::Error::new(io::ErrorKind::InvalidData, format!("The port (number) must have either a single non-negative integer ('\\d+') or a range formatted as '\\d+-\\d+'. Found '{characters}'"))),
-                        }
-                    },
-                }
-            },
-            Ok(XmlEvent::EndElement { name }) => {
-                if name.local_name != NUMBER_LOCAL_NAME {
-                    return Err(io::Error::new(io::ErrorKind::InvalidData, format!("A port (number) entry was closed with a '{}' tag", name.local_name)));
-                }
-                break;
-            },
-            Ok(_) => (),
-            Err(error) => return Err(io::Error::new(io::ErrorKind::Other, error)),
+    #[test]
+    fn test_services_are_unique() {
+        for (protocol, services) in PROTOCOL_SERVICES.iter() {
+            for window in services.windows(2) {
+                assert!(window[0].0 < window[1].0, "{protocol} services '{}' and '{}' are duplicated or out of order", window[0].0, window[1].0);
+            }
         }
     }
-    
-    return Ok(ports);
-}
-
-fn parse_record<R>(parser: &mut EventReader<R>) -> io::Result<Option<(String, Protocol, Vec<u16>)>> where R: Read {
-    let mut record_name = None;
-    let mut record_protocol = None;
-    let mut record_ports = None;
 
-    loop {
-        let event = parser.next();
-        match event {
-            Ok(XmlEvent::EndDocument) => return Err(io::Error::from(io::ErrorKind::UnexpectedEof)),
-            Ok(XmlEvent::StartElement { name, attributes: _, namespace: _ }) => {
-                match name.local_name.as_str() {
-                    NAME_LOCAL_NAME => match (record_name, parse_name(parser)) {
-                        (Some(_), _) => return Err(io::Error::new(io::ErrorKind::InvalidData, format!("The name entry was found twice within a record. It can only appear once."))),
-                        (None, Ok(name)) => record_name = name,
-                        (None, Err(error)) => return Err(error),
-                    },
-                    PROTOCOL_LOCAL_NAME => match (record_protocol, parse_protocol(parser)) {
-                        (Some(_), _) => return Err(io::Error::new(io::ErrorKind::InvalidData, format!("The protocol entry was found twice within a record. It can only appear once."))),
-                        (None, Ok(protocol)) => record_protocol = protocol,
-                        (None, Err(error)) => return Err(error),
-                    },
-                    NUMBER_LOCAL_NAME => match (record_ports, parse_ports(parser)) {
-                        (Some(_), _) => return Err(io::Error::new(io::ErrorKind::InvalidData, format!("The port (number) entry was found twice within a record. It can only appear once."))),
-                        (None, Ok(ports)) => record_ports = ports,
-                        (None, Err(error)) => return Err(error),
-                    },
-                    _ => (),
+    #[test]
+    fn test_ports_are_sorted_and_unique() {
+        for (protocol, services) in PROTOCOL_SERVICES.iter() {
+            for (service, start, end) in services.iter() {
+                assert!(start < end, "{protocol} service '{service}' has no ports");
+                let ports = &PORTS[(*start as usize)..(*end as usize)];
+                for window in ports.windows(2) {
+                    assert!(window[0] < window[1], "{protocol} service '{service}' has ports {ports:?}");
                 }
-            },
-            Ok(XmlEvent::EndElement { name }) => {
-                if name.local_name != RECORD_LOCAL_NAME {
-                    continue;
-                }
-                break;
-            },
-            Ok(_) => (),
-            Err(error) => return Err(io::Error::new(io::ErrorKind::Other, error)),
+            }
         }
     }
 
-    match (record_name, record_protocol, record_ports) {
-        (None, _, _) => return Ok(None),
-        (_, None, _) => return Ok(None),
-        (_, _, None) => return Ok(None),
-        (Some(name), Some(protocol), Some(ports)) => return Ok(Some((name, protocol, ports))),
+    #[test]
+    fn test_service_names_are_lower_case() {
+        for (_, services) in PROTOCOL_SERVICES.iter() {
+            for (service, _, _) in services.iter() {
+                assert!(!service.bytes().any(|byte| byte.is_ascii_uppercase()), "service '{service}' is not lower case");
+            }
+        }
     }
 }
 
-fn load_port_service_map() -> io::Result<HashMap<(String, Protocol), Vec<u16>>> {
-    let start_time = Instant::now();
-
-    let file = BufReader::new(File::open("./port-assignments.xml")?);
-
-    let config = ParserConfig::new()
-        .trim_whitespace(true)
-        .cdata_to_characters(true)
-        .ignore_comments(true)
-        .coalesce_characters(true)
-        // If we ever see the depth go past 5, the file format has changed and we need to review the
-        // changes.
-        .max_entity_expansion_depth(5);
-
-    let mut parser = EventReader::new_with_config(file, config);
-
-    let mut port_service_map: HashMap<(String, Protocol), Vec<u16>> = HashMap::new();
-
-    loop {
-        let event = parser.next();
-        match event {
-            Ok(event) => match event {
-                XmlEvent::StartDocument { version: _, encoding: _, standalone: _ } => (),
-                XmlEvent::EndDocument => break,
-                XmlEvent::ProcessingInstruction { name: _, data: _ } => (),
-                XmlEvent::StartElement { name, attributes: _, namespace: _ } => match name.local_name.as_str() {
-                    RECORD_LOCAL_NAME => match parse_record(&mut parser) {
-                        Ok(Some((name, protocol, ports))) => {
-                            if let Some(stored_ports) = port_service_map.get_mut(&(name.clone(), protocol.clone())) {
-                                stored_ports.extend(ports)
-                            } else {
-                                port_service_map.insert((name, protocol), ports);
-                            }
-                        },
-                        Ok(None) => (),
-                        Err(error) => println!("Failed to parse port: {error}"),
-                    },
-                    _ => (),
-                },
-                _ => (),
-            },
-            Err(error) => return Err(io::Error::new(io::ErrorKind::Other, error)),
-        }
+#[cfg(test)]
+mod port_from_service_tests {
+    use crate::resource_record::{ports::PortError, protocol::Protocol};
+    use super::port_from_service;
+
+    #[test]
+    fn test_known_services() {
+        assert_eq!(Ok([22].as_slice()), port_from_service("ssh", Protocol::TCP));
+        assert_eq!(Ok([53].as_slice()), port_from_service("domain", Protocol::TCP));
+        assert_eq!(Ok([53].as_slice()), port_from_service("domain", Protocol::UDP));
+        assert_eq!(Ok([80].as_slice()), port_from_service("http", Protocol::TCP));
     }
 
-    let end_time = Instant::now();
-    let total_duration = end_time - start_time;
-    println!("Loading Port Service Mappings took {} ms", total_duration.as_millis());
-    
-    Ok(port_service_map)
-}
-
-lazy_static! {
-    pub static ref PORT_SERVICE_MAP: HashMap<(String, Protocol), Vec<u16>> = load_port_service_map().unwrap();
-}
+    #[test]
+    fn test_mixed_case_services() {
+        assert_eq!(Ok([22].as_slice()), port_from_service("SSH", Protocol::TCP));
+        assert_eq!(Ok([53].as_slice()), port_from_service("Domain", Protocol::UDP));
+    }
 
-#[inline]
-pub fn port_from_service(service: String, protocol: Protocol) -> Result<&'static [u16], PortError> {
-    match PORT_SERVICE_MAP.get(&(service.clone(), protocol.clone())) {
-        Some(ports) => Ok(ports),
-        None => Err(PortError::UnknownMnemonic(service, protocol)),
+    #[test]
+    fn test_unknown_services() {
+        assert_eq!(Err(PortError::UnknownMnemonic("not-a-service".to_string(), Protocol::TCP)), port_from_service("not-a-service", Protocol::TCP));
+        assert_eq!(Err(PortError::UnknownMnemonic("NOT-A-SERVICE".to_string(), Protocol::TCP)), port_from_service("NOT-A-SERVICE", Protocol::TCP));
+        assert_eq!(Err(PortError::UnknownMnemonic("ssh".to_string(), Protocol::ICMP)), port_from_service("ssh", Protocol::ICMP));
+        assert!(port_from_service(&"A".repeat(100), Protocol::TCP).is_err());
     }
 }
@@ -97,7 +97,7 @@ impl FromTokenizedRData for WKS {
                     &u16::from_token_format(&[service])?.0
                 );
             } else {
-                let ports = match port_from_service(service.to_string(), protocol.clone()) {
+                let ports = match port_from_service(service, protocol) {
                     Ok(ports) => ports,
                     Err(error) => Err(TokenError::PortError(error))?,
                 };
@@ -223,6 +223,9 @@ mod tokenizer_tests {
     const GOOD_PORT_FTP: &str = "ftp";
     // SSH is port 22
     const GOOD_PORT_SSH: &str = "ssh";
+    // Service names are case insensitive
+    const GOOD_PORT_FTP_UPPER: &str = "FTP";
+    const GOOD_PORT_SSH_MIXED: &str = "sSh";
     const BAD_PORT: &str = "THIS IS NOT A PORT AND WILL FAIL";
 
     gen_ok_record_test!(
@@ -239,6 +242,13 @@ mod tokenizer_tests {
             bit_map: vec![0b00000000, 0b00000000, 0b00000110]
         }, [GOOD_IP, GOOD_PROTOCOL, GOOD_PORT_FTP, GOOD_PORT_SSH]
     );
+    gen_ok_record_test!(
+        test_ok_ftp_ssh_mixed_case, WKS, WKS {
+            address: Ipv4Addr::new(192, 168, 86, 1),
+            protocol: Protocol::TCP,
+            bit_map: vec![0b00000000, 0b00000000, 0b00000110]
+        }, [GOOD_IP, GOOD_PROTOCOL, GOOD_PORT_FTP_UPPER, GOOD_PORT_SSH_MIXED]
+    );
     gen_ok_record_test!(
         test_ok_tcpmux_ftp, WKS, WKS {
             address: Ipv4Addr::new(192, 168, 86, 1),
@@ -1,7 +1,8 @@
 #!/bin/bash -e
 
-# Gets an updated version of the file "port-assignments.xml" from IANA. This file is used for
-# converting well-known-services into their respective port numbers. By using a configurable file,
-# custom ports can be added as needed.
+# Gets an updated version of the file "dns-lib/port-assignments.xml" from IANA. This file is used by
+# the dns-lib build script to generate the table that converts well-known-services into their
+# respective port numbers. Custom ports can be added to the file as needed, but dns-lib has to be
+# rebuilt before they take effect.
 
-wget -q -O "port-assignments.xml" "https://www.iana.org/assignments/service-names-port-numbers/service-names-port-numbers.xml"
+wget -q -O "$(dirname "$0")/dns-lib/port-assignments.xml" "https://www.iana.org/assignments/service-names-port-numbers/service-names-port-numbers.xml"